@@ -0,0 +1,164 @@
+"""
+Triage a compound library
+
+Screen a whole compound library in memory-bounded chunks.  Compounds whose
+control (pc) replicates show non-equilibration or instability are flagged and
+excluded, KDs with intervals are derived for the remainder from lwhite or pt
+measurements, and ranked top-k hit lists are produced by KD and by interval
+width.
+"""
+import numpy as np
+from microdialysis_equations import *
+
+# We can choose to work in a common unit, typically nM, or uM, as long as all
+# numbers are in the same unit, the result is valid.  We assume uM for all
+# concentrations bellow.  If uM is used for concentrations, then ul should be
+# used as the standard unit for volume etc.
+
+
+#  - l0 is total compound, or ligand concentration over the entire volume
+#     if no protein was present (25 equal to starting in the red chamber
+#     with a conc of 100 µM if chambers are 100 and 300 ul)
+#  - t0 is target, or protein concentration in the red chamber.
+#  - redvol is the volume of the red chamber (the protein-containing chamber)
+#  - whitevol is the volume of the white chamber (the no protein chamber)
+#  - READOUT selects the measurement KDs are derived from, either "lwhite"
+#     or "pt".
+#  - PC_TOLERANCE is the largest allowed deviation of the mean pc from 1.0
+#     before a compound is flagged as not equilibrating.
+#  - PC_MAX_RSD is the largest allowed relative standard deviation of pc
+#     replicates before a compound is flagged as unstable.
+#  - CHUNK_SIZE is the number of compounds held in memory at any one time.
+#  - TOP_K is the length of the ranked hit lists.
+
+t0 = 80
+l0 = 50
+redvol = 100
+whitevol = 300
+READOUT = "lwhite"
+PC_TOLERANCE = 0.1
+PC_MAX_RSD = 0.05
+N_COMPOUNDS = 1_000_000
+N_REPLICATES = 3
+CHUNK_SIZE = 100_000
+TOP_K = 10
+
+FLAG_NON_EQUILIBRATING = 1
+FLAG_UNSTABLE = 2
+FLAG_INVALID_KD = 4
+
+
+def simulated_library_chunks(n_compounds: int, n_replicates: int, chunk_size: int, seed: int = 0):
+    """Generate simulated library measurements, one chunk at a time
+
+    Replace this generator with one reading chunks of real plate reader
+    output to triage an experimental library.
+
+    Args:
+        n_compounds (int): Number of compounds in the library
+        n_replicates (int): Number of replicate measurements per compound
+        chunk_size (int): Number of compounds per chunk
+        seed (int): Seed for the random number generator
+
+    Yields:
+        dict: compound_id, readout and pc arrays, with replicates along axis 1
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_compounds, chunk_size):
+        n = min(chunk_size, n_compounds - start)
+        true_kd = 10**rng.uniform(-1, 4, n)
+        # Most compounds equilibrate, a minority stick to the membrane or
+        # degrade, giving a pc drifting away from 1.0
+        true_pc = np.where(rng.random(n) < 0.9, 1.0, rng.uniform(0.5, 2.0, n))
+        pc_noise = np.where(rng.random(n) < 0.95, 0.01, 0.2)
+        pc = true_pc[:, None] * (1 + pc_noise[:, None] * rng.standard_normal((n, n_replicates)))
+        if READOUT == "lwhite":
+            readout = qud_lwhite(t0, l0, true_kd, redvol, whitevol, true_pc)
+        else:
+            readout = qud_pt(t0, l0, true_kd, redvol, whitevol, true_pc)
+        readout = readout[:, None] * (1 + 0.01 * rng.standard_normal((n, n_replicates)))
+        yield {"compound_id": np.arange(start, start + n), "readout": readout, "pc": pc}
+
+
+def triage_chunk(chunk: dict):
+    """Flag poor equilibrators and derive KDs with intervals for a chunk
+
+    The KD interval is the range of KDs obtained from the corners of the
+    mean +/- standard deviation box of the readout and pc replicates.
+
+    Args:
+        chunk (dict): compound_id, readout and pc arrays
+
+    Returns:
+        tuple: compound ids, flags, KD, lower KD and upper KD arrays
+    """
+    kd_from_readout = qud_Kd_from_lwhite if READOUT == "lwhite" else qud_Kd_from_pt
+    pc_mean = np.mean(chunk["pc"], axis=1)
+    pc_std = np.std(chunk["pc"], axis=1)
+    readout_mean = np.mean(chunk["readout"], axis=1)
+    readout_std = np.std(chunk["readout"], axis=1)
+
+    flags = np.zeros(len(pc_mean), dtype=np.uint8)
+    flags[np.abs(pc_mean - 1.0) > PC_TOLERANCE] |= FLAG_NON_EQUILIBRATING
+    flags[pc_std / pc_mean > PC_MAX_RSD] |= FLAG_UNSTABLE
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kd = kd_from_readout(readout_mean, t0, l0, redvol, whitevol, pc_mean)
+        corners = np.stack([kd_from_readout(readout_mean + r, t0, l0, redvol, whitevol, pc_mean + p)
+                            for r in (-readout_std, readout_std) for p in (-pc_std, pc_std)])
+    kd_low = np.min(corners, axis=0)
+    kd_high = np.max(corners, axis=0)
+    invalid = ~(np.isfinite(kd) & np.isfinite(kd_low) & np.isfinite(kd_high) & (kd > 0) & (kd_low > 0))
+    flags[invalid] |= FLAG_INVALID_KD
+    return chunk["compound_id"], flags, kd, kd_low, kd_high
+
+
+def merge_top_k(best_keys, best_rows, keys, rows, k: int):
+    """Keep the k rows with the smallest keys, using a partial sort
+
+    Args:
+        best_keys (np.ndarray): Keys of the current top-k
+        best_rows (np.ndarray): Rows (id, KD, lower KD, upper KD) of the current top-k
+        keys (np.ndarray): Keys of the new candidates
+        rows (np.ndarray): Rows of the new candidates
+        k (int): Number of rows to keep
+
+    Returns:
+        tuple: Keys and rows of the merged top-k, unordered
+    """
+    keys = np.concatenate([best_keys, keys])
+    rows = np.concatenate([best_rows, rows])
+    if len(keys) > k:
+        keep = np.argpartition(keys, k - 1)[:k]
+        keys, rows = keys[keep], rows[keep]
+    return keys, rows
+
+
+flag_counts = {"non-equilibrating": 0, "unstable": 0, "invalid KD": 0}
+n_passed = 0
+top_by_kd = (np.empty(0), np.empty((0, 4)))
+top_by_width = (np.empty(0), np.empty((0, 4)))
+
+for chunk in simulated_library_chunks(N_COMPOUNDS, N_REPLICATES, CHUNK_SIZE):
+    compound_id, flags, kd, kd_low, kd_high = triage_chunk(chunk)
+    flag_counts["non-equilibrating"] += np.count_nonzero(flags & FLAG_NON_EQUILIBRATING)
+    flag_counts["unstable"] += np.count_nonzero(flags & FLAG_UNSTABLE)
+    flag_counts["invalid KD"] += np.count_nonzero(flags & FLAG_INVALID_KD)
+    passed = flags == 0
+    n_passed += np.count_nonzero(passed)
+    rows = np.column_stack([compound_id, kd, kd_low, kd_high])[passed]
+    top_by_kd = merge_top_k(*top_by_kd, rows[:, 1], rows, TOP_K)
+    top_by_width = merge_top_k(*top_by_width, rows[:, 3] - rows[:, 2], rows, TOP_K)
+
+print(f"Triaged {N_COMPOUNDS} compounds from {READOUT} in chunks of {CHUNK_SIZE}")
+for reason, count in flag_counts.items():
+    print(f"  {reason:>18}: {count}")
+print(f"  {'passed':>18}: {n_passed}")
+
+for title, (keys, rows) in [("Top hits by KD", top_by_kd), ("Top hits by KD interval width", top_by_width)]:
+    print()
+    print(title)
+    print("*" * len(title))
+    print(f"{'compound':>10},{'KD':>12},{'KD low':>12},{'KD high':>12}")
+    for row in rows[np.argsort(keys)]:
+        print(f"{int(row[0]):>10},{row[1]:>12.4f},{row[2]:>12.4f},{row[3]:>12.4f}")
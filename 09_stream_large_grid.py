@@ -0,0 +1,66 @@
+"""
+Stream reductions over a large simulation grid
+
+Evaluate lwhite over a KD x t0 x l0 grid far too large to hold in memory,
+producing the minimum, maximum, a histogram and the l0 concentrations at
+which lwhite crosses a threshold in a single pass, whilst only ever holding
+one chunk of the grid.
+"""
+import numpy as np
+from microdialysis_equations import *
+
+# We can choose to work in a common unit, typically nM, or uM, as long as all
+# numbers are in the same unit, the result is valid.  We assume uM for all
+# concentrations bellow.  If uM is used for concentrations, then ul should be
+# used as the standard unit for volume etc.
+
+#  - Each axis is given its own array dimension, so that broadcasting the
+#     axes together describes the full grid without creating it.
+#  - MEMORY_BUDGET is the memory, in bytes, evaluation of one chunk may use.
+#     Larger chunks amortise per-chunk overhead, smaller ones use less memory.
+#  - LWHITE_THRESHOLD is the lwhite concentration whose crossing points along
+#     the l0 axis are reported.
+
+N_POINTS_PER_AXIS = 1000
+MEMORY_BUDGET = 256 * 1024**2
+LWHITE_THRESHOLD = 40.0
+
+kd_axis = np.linspace(1, 500, N_POINTS_PER_AXIS)
+t0_axis = np.linspace(1, 100, N_POINTS_PER_AXIS)
+l0_axis = np.linspace(1, 100, N_POINTS_PER_AXIS)
+system_parameters = {
+    'kdtl': kd_axis[:, None, None],
+    't0': t0_axis[None, :, None],
+    'l0': l0_axis[None, None, :],
+    'redvol': 100,
+    'whitevol': 300,
+    'pc': 1.0,
+}
+chunk_size = qud_chunk_size(MEMORY_BUDGET)
+shape = qud_broadcast_shape(**system_parameters)
+print(f"Grid of shape {shape} ({np.prod(shape)} elements) in chunks of {chunk_size}")
+
+
+def describe(index):
+    kd_i, t0_i, l0_i = index
+    return f"KD={kd_axis[kd_i]:.2f}, t0={t0_axis[t0_i]:.2f}, l0={l0_axis[l0_i]:.2f}"
+
+
+# All four reductions are made in a single pass, evaluating the grid once
+(minimum, minimum_index), (maximum, maximum_index), (counts, edges), (kd_i, t0_i, l0_i) = qud_stream_reduce(
+    qud_lwhite,
+    [QudArgExtreme(), QudArgExtreme(maximum=True), QudHistogram(np.linspace(0, 100, 11)), QudCrossings(LWHITE_THRESHOLD)],
+    chunk_size, **system_parameters)
+print(f"Minimum lwhite of {minimum:.4f} at {describe(minimum_index)}")
+print(f"Maximum lwhite of {maximum:.4f} at {describe(maximum_index)}")
+
+print()
+print("Histogram of lwhite")
+print("*******************")
+for count, low, high in zip(counts, edges[:-1], edges[1:]):
+    print(f"{low:>6.1f} - {high:>6.1f} µM: {count}")
+
+print()
+print(f"lwhite crosses {LWHITE_THRESHOLD} µM {len(kd_i)} times along the l0 axis")
+if len(kd_i):
+    print(f"First crossing at {describe((kd_i[0], t0_i[0], l0_i[0]))}")
@@ -0,0 +1,47 @@
+"""
+Multithreaded evaluation of large arrays
+
+Derive KDs from a large array of lred values, once with a single call to
+qud_Kd_from_lred and then in cache-sized chunks on thread pools of increasing
+size, reporting the speedup and checking results are bit-identical.
+"""
+import os
+import time
+import numpy as np
+from microdialysis_equations import *
+
+# We can choose to work in a common unit, typically nM, or uM, as long as all
+# numbers are in the same unit, the result is valid.  We assume uM for all
+# concentrations bellow.  If uM is used for concentrations, then ul should be
+# used as the standard unit for volume etc.
+
+#  - N_ELEMENTS is the number of lred observations to derive KDs from.  The
+#     input and output arrays each take 8 bytes per element.
+#  - WORKER_COUNTS are the thread pool sizes to time, defaulting to powers of
+#     two up to the number of CPUs.
+
+N_ELEMENTS = 10_000_000
+WORKER_COUNTS = [2**i for i in range(os.cpu_count().bit_length()) if 2**i <= os.cpu_count()]
+
+rng = np.random.default_rng(0)
+system_parameters = {
+    'lred': rng.uniform(30, 70, N_ELEMENTS),
+    't0': 80,
+    'l0': 50,
+    'redvol': 100,
+    'whitevol': 300,
+    'pc': 1.0,
+}
+
+start = time.perf_counter()
+reference = qud_Kd_from_lred(**system_parameters)
+single_call_time = time.perf_counter() - start
+print(f"Single call on {N_ELEMENTS} elements: {single_call_time:.3f} s")
+
+print(f"{'workers':>10},{'time (s)':>10},{'speedup':>10},{'identical':>10}")
+for workers in WORKER_COUNTS:
+    start = time.perf_counter()
+    result = qud_parallel(qud_Kd_from_lred, workers=workers, **system_parameters)
+    elapsed = time.perf_counter() - start
+    identical = np.array_equal(result, reference, equal_nan=True)
+    print(f"{workers:>10},{elapsed:>10.3f},{single_call_time / elapsed:>10.2f},{str(identical):>10}")
@@ -0,0 +1,140 @@
+"""
+Verify KD round trips across the parameter space
+
+Sample random qµD systems, simulate lred, lwhite and pt from a known KD and
+derive the KD back again, reporting the relative error of the recovered KD
+and the parameter regions where the largest errors occur.  The copies of the
+equations in 06_calc_derivatives.py are checked against
+microdialysis_equations.py on the same samples.  The program exits with a
+non-zero status if any check fails, so that it may gate changes to the
+equations.
+"""
+import ast
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from microdialysis_equations import *
+
+# Parameters are sampled log-uniformly between the limits below.  Volumes are
+# sampled as a red chamber volume and a white to red volume ratio.
+#  - N_SAMPLES is the number of random systems, evaluated CHUNK_SIZE at a time.
+#  - MAX_P99_ERROR is the largest allowed 99th percentile relative error of
+#     round trip KDs, and MAX_DRIFT the largest allowed relative difference
+#     between the equations in 06_calc_derivatives.py and
+#     microdialysis_equations.py.  Round trips are ill-conditioned where l0
+#     greatly exceeds t0 and the observed concentrations barely depend on KD,
+#     so the maximum error is reported but not gated.
+
+N_SAMPLES = 10_000_000
+CHUNK_SIZE = 1_000_000
+PARAMETER_RANGES = {
+    'kdtl': (1e-2, 1e4),
+    't0': (1e-1, 1e3),
+    'l0': (1e-1, 1e3),
+    'redvol': (10, 1000),
+    'volume_ratio': (0.1, 10),
+    'pc': (0.5, 2.0),
+}
+MAX_P99_ERROR = 1e-5
+MAX_DRIFT = 1e-12
+ERROR_BINS = np.concatenate([[0], np.logspace(-17, 3, 2001), [np.inf]])
+REGION_DECADES = np.arange(-3, 6)
+
+ROUND_TRIPS = {
+    'lred': (qud_lred, qud_Kd_from_lred),
+    'lwhite': (qud_lwhite, qud_Kd_from_lwhite),
+    'pt': (qud_pt, qud_Kd_from_pt),
+}
+
+
+def sample_parameters(rng, n: int):
+    """Sample n random systems, log-uniformly within PARAMETER_RANGES"""
+    sample = {name: np.exp(rng.uniform(np.log(low), np.log(high), n)) for name, (low, high) in PARAMETER_RANGES.items()}
+    sample['whitevol'] = sample['redvol'] * sample.pop('volume_ratio')
+    return sample
+
+
+def load_equation_copies(path: Path):
+    """Load the qud_* functions defined in another program without running it"""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    tree.body = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name.startswith("qud_")]
+    namespace = {'sqrt': np.sqrt}
+    exec(compile(tree, str(path), "exec"), namespace)
+    return {name: f for name, f in namespace.items() if name.startswith("qud_")}
+
+
+def relative_error(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs(a - b) / np.abs(b)
+
+
+def max_drift(copy_result, result):
+    """Largest relative difference between a copy's results and the original's, infinite
+    where only one is NaN or the difference is otherwise not finite"""
+    drift = relative_error(copy_result, result)
+    both_nan = np.isnan(copy_result) & np.isnan(result)
+    drift[~both_nan & ~np.isfinite(drift)] = np.inf
+    drift[both_nan | (copy_result == result)] = 0.0
+    return np.max(drift, initial=0.0)
+
+
+equation_copies = load_equation_copies(Path(__file__).with_name("06_calc_derivatives.py"))
+rng = np.random.default_rng(0)
+error_counts = {name: np.zeros(len(ERROR_BINS) - 1, dtype=np.int64) for name in ROUND_TRIPS}
+worst = {name: (-1.0, None) for name in ROUND_TRIPS}
+region_max = {name: np.full((len(REGION_DECADES) + 1, len(REGION_DECADES) + 1), np.nan) for name in ROUND_TRIPS}
+drift = {name: 0.0 for name in equation_copies}
+
+start_time = time.perf_counter()
+for start in range(0, N_SAMPLES, CHUNK_SIZE):
+    sample = sample_parameters(rng, min(CHUNK_SIZE, N_SAMPLES - start))
+    system = {k: sample[k] for k in ('t0', 'l0', 'redvol', 'whitevol', 'pc')}
+    # Regions are decades of KD/t0 (rows) and l0/t0 (columns)
+    kd_region = np.digitize(np.log10(sample['kdtl'] / sample['t0']), REGION_DECADES)
+    l0_region = np.digitize(np.log10(sample['l0'] / sample['t0']), REGION_DECADES)
+    for name, (forward, inverse) in ROUND_TRIPS.items():
+        observed = qud_parallel(forward, kdtl=sample['kdtl'], **system)
+        recovered = qud_parallel(inverse, **{name: observed}, **system)
+        error = relative_error(recovered, sample['kdtl'])
+        error[~np.isfinite(error)] = np.inf
+        error_counts[name] += np.histogram(error, ERROR_BINS)[0]
+        i = np.argmax(error)
+        if error[i] > worst[name][0]:
+            worst[name] = (error[i], {k: v[i] for k, v in sample.items()})
+        np.fmax.at(region_max[name], (kd_region, l0_region), error)
+        for f in (forward, inverse):
+            args = {'kdtl': sample['kdtl']} if f is forward else {name: observed}
+            copy_result = equation_copies[f.__name__](**args, **system)
+            drift[f.__name__] = max(drift[f.__name__], max_drift(copy_result, f(**args, **system)))
+elapsed = time.perf_counter() - start_time
+print(f"Verified {N_SAMPLES} random systems in {elapsed:.1f} s")
+
+failed = False
+for name in ROUND_TRIPS:
+    cumulative = np.cumsum(error_counts[name]) / N_SAMPLES
+    percentiles = {p: ERROR_BINS[1:][np.searchsorted(cumulative, p / 100)] for p in (50, 99, 99.9)}
+    max_error, parameters = worst[name]
+    print()
+    print(f"KD from {name}")
+    print("*" * len(f"KD from {name}"))
+    print("Relative error upper bounds: " + ", ".join(f"p{p}={v:.1e}" for p, v in percentiles.items()))
+    print(f"Maximum relative error {max_error:.2e} at " + ", ".join(f"{k}={v:.4g}" for k, v in parameters.items()))
+    print("Maximum relative error by region, log10(KD/t0) rows versus log10(l0/t0) columns:")
+    labels = [f"<{REGION_DECADES[0]}"] + [f">={d}" for d in REGION_DECADES]
+    print(f"{'':>8}" + "".join(f"{label:>9}" for label in labels))
+    for label, row in zip(labels, region_max[name]):
+        print(f"{label:>8}" + "".join(f"{'-':>9}" if np.isnan(v) else f"{v:>9.1e}" for v in row))
+    if percentiles[99] > MAX_P99_ERROR:
+        print(f"FAILED: 99th percentile relative error above {MAX_P99_ERROR}")
+        failed = True
+
+print()
+print("Equation copies in 06_calc_derivatives.py")
+print("*****************************************")
+for name, value in drift.items():
+    status = "ok" if value <= MAX_DRIFT else "FAILED"
+    failed |= not value <= MAX_DRIFT
+    print(f"{name:>20}: maximum relative difference {value:.1e} {status}")
+
+sys.exit(1 if failed else 0)
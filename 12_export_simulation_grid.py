@@ -0,0 +1,342 @@
+"""
+Export simulation grids to CSV, Parquet and xlsx
+
+Stream a sweep of lred, lwhite and pt over a KD x t0 x l0 grid, and a batch of
+KDs derived from lwhite observations, to CSV, Parquet and xlsx files chunk by
+chunk, so the full table is never held in memory.  Each file records the grid
+axes and fixed parameters it was produced from.  Finally the formulas in
+quDSimulation_v1.xlsx are evaluated over a grid and compared to the Python
+functions.
+
+Parquet export requires pyarrow and xlsx export and the spreadsheet
+cross-check require openpyxl.
+"""
+import ast
+import inspect
+import json
+import re
+import sys
+from pathlib import Path
+import numpy as np
+from microdialysis_equations import *
+
+# We can choose to work in a common unit, typically nM, or uM, as long as all
+# numbers are in the same unit, the result is valid.  We assume uM for all
+# concentrations bellow.  If uM is used for concentrations, then ul should be
+# used as the standard unit for volume etc.
+
+#  - Each axis of the sweep is given its own array dimension, see
+#     09_stream_large_grid.py.  One row is written per grid point.
+#  - FORMATS lists the file formats to write, from "csv", "parquet", "xlsx".
+#  - CHUNK_SIZE is the number of rows held in memory at once.
+#  - CROSS_CHECK enables comparison of Python results to the formulas in
+#     SPREADSHEET, exiting with a non-zero status if any differ by more than
+#     CROSS_CHECK_TOLERANCE.  The spreadsheet calculates pt as lred/lwhite
+#     rather than with qud_pt, so agreement is to within rounding rather than
+#     exact.
+
+OUTPUT_DIRECTORY = Path("exports")
+FORMATS = ["csv", "parquet", "xlsx"]
+CHUNK_SIZE = 100_000
+CROSS_CHECK = True
+SPREADSHEET = Path(__file__).with_name("quDSimulation_v1.xlsx")
+CROSS_CHECK_TOLERANCE = 1e-9
+XLSX_MAX_ROWS = 1_048_576
+
+sweep_parameters = {
+    'kdtl': np.linspace(1, 500, 1000)[:, None, None],
+    't0': np.linspace(10, 100, 10)[None, :, None],
+    'l0': np.linspace(10, 100, 10)[None, None, :],
+    'redvol': 100,
+    'whitevol': 300,
+    'pc': 1.0,
+}
+sweep_columns = {'lred': qud_lred, 'lwhite': qud_lwhite, 'pt': qud_pt}
+
+batch_kd_parameters = {
+    'lwhite': np.linspace(30, 49.9, 1000)[:, None],
+    't0': np.linspace(1, 100, 100)[None, :],
+    'l0': 50,
+    'redvol': 100,
+    'whitevol': 300,
+    'pc': 1.0,
+}
+batch_kd_columns = {'KD': qud_Kd_from_lwhite}
+
+
+def _parameter_column(name: str):
+    return lambda **params: np.asarray(params[name], dtype=float)
+
+
+def table_chunks(columns: dict, chunk_size: int, **params):
+    """Generate a results table over a broadcast grid, chunk by chunk
+
+    Args:
+        columns (dict): Column names mapped to the qud_* functions computing them
+        chunk_size (int): Maximum number of rows per chunk
+        **params: Keyword arguments to the column functions, each a scalar or array
+
+    Yields:
+        np.ndarray: 2D array with one row per grid point, and a column for each parameter then each result
+    """
+    generators = [qud_iter_chunks(_parameter_column(name), chunk_size, **params) for name in params]
+    generators += [qud_iter_chunks(func, chunk_size, **params) for func in columns.values()]
+    for parts in zip(*generators):
+        yield np.column_stack([values for _, values in parts])
+
+
+def table_metadata(columns: dict, **params):
+    """Describe the grid axes and fixed parameters a table is produced from"""
+    shape = qud_broadcast_shape(**params)
+    parameters = {}
+    for name, value in params.items():
+        value = np.asarray(value)
+        if value.size == 1:
+            parameters[name] = value.item()
+        else:
+            axes = [len(shape) - value.ndim + i for i, n in enumerate(value.shape) if n > 1]
+            parameters[name] = {'axes': axes, 'values': value.squeeze().tolist()}
+    return {
+        'program': Path(__file__).name,
+        'columns': list(params) + list(columns),
+        'grid_shape': list(shape),
+        'parameters': parameters,
+    }
+
+
+def write_csv(path: Path, chunks, metadata: dict):
+    """Write table chunks to CSV, preceded by metadata as '# ' comment lines"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for key, value in metadata.items():
+            f.write(f"# {key}: {json.dumps(value)}\n")
+        f.write(",".join(metadata['columns']) + "\n")
+        for chunk in chunks:
+            np.savetxt(f, chunk, fmt="%.17g", delimiter=",")
+
+
+def write_parquet(path: Path, chunks, metadata: dict):
+    """Write table chunks to Parquet, one row group per chunk, with metadata in the schema"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, pa.float64()) for name in metadata['columns']],
+                       metadata={key: json.dumps(value) for key, value in metadata.items()})
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_arrays(list(chunk.T), schema=schema))
+
+
+def write_xlsx(path: Path, chunks, metadata: dict):
+    """Write table chunks to a write-only xlsx workbook, with a Metadata sheet
+
+    Results continue onto further sheets once a sheet reaches the xlsx row
+    limit.  NaNs are written as empty cells.
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    metadata_sheet = workbook.create_sheet("Metadata")
+    for key, value in metadata.items():
+        metadata_sheet.append([key, json.dumps(value)])
+    sheet, sheet_rows, n_sheets = None, XLSX_MAX_ROWS, 0
+    for chunk in chunks:
+        for row in chunk.tolist():
+            if sheet_rows == XLSX_MAX_ROWS:
+                n_sheets += 1
+                sheet = workbook.create_sheet("Results" if n_sheets == 1 else f"Results {n_sheets}")
+                sheet.append(metadata['columns'])
+                sheet_rows = 1
+            sheet.append([None if v != v else v for v in row])
+            sheet_rows += 1
+    workbook.save(path)
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'xlsx': write_xlsx}
+
+# Labels used in quDSimulation_v1.xlsx, mapped to qud_* parameter names.  The
+# value of each labelled quantity is in the cell to the right of its label.
+SPREADSHEET_LABELS = {
+    '[t0]': 't0', '[l0]': 'l0', 'redvol': 'redvol', 'whitevol': 'whitevol', 'pc': 'pc',
+    'KD': 'kdtl', '[lred]': 'lred', '[lwhite]': 'lwhite', 'pt': 'pt',
+}
+# Column headers of table sheets, such as DataSheet, which tabulate results
+# over rows of KDs rather than labelling single values.
+SPREADSHEET_COLUMNS = {'Kd': 'kdtl', '[c] Red': 'lred', '[c] White': 'lwhite'}
+CELL_REFERENCE = re.compile(r"(?:(\w+|'[^']+')!)?\$?\b([A-Z]{1,3})\$?(\d+)\b")
+
+
+class _ExcelPowerPrecedence(ast.NodeTransformer):
+    """In Excel, unary minus binds tighter than ^, so -x^2 is (-x)^2, but -(x^2) is not"""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if (isinstance(node.op, ast.USub) and isinstance(node.operand, ast.BinOp) and isinstance(node.operand.op, ast.Pow)
+                and "(" not in self.expression[node.col_offset:node.operand.col_offset]):
+            power = node.operand
+            return ast.BinOp(ast.UnaryOp(ast.USub(), power.left), ast.Pow(), power.right)
+        return node
+
+
+def excel_formula_to_python(formula: str, sheet_name: str):
+    """Translate an arithmetic Excel formula to a Python expression
+
+    Cell references become calls to cell("Sheet", "B13"), with references
+    lacking a sheet name referring to sheet_name.  Only the operators and
+    functions used in quDSimulation_v1.xlsx (POWER and SQRT) are supported.
+
+    Args:
+        formula (str): Excel formula, starting with '='
+        sheet_name (str): Name of the sheet containing the formula
+
+    Returns:
+        code: Compiled expression
+    """
+    def reference(match):
+        return f'cell({(match.group(1) or sheet_name).strip(chr(39))!r}, "{match.group(2)}{match.group(3)}")'
+
+    expression = formula.strip().lstrip("=").replace("\n", " ").replace("^", "**")
+    expression = expression.replace("POWER(", "power(").replace("SQRT(", "sqrt(")
+    expression = CELL_REFERENCE.sub(reference, expression).strip()
+    tree = ast.fix_missing_locations(_ExcelPowerPrecedence(expression).visit(ast.parse(expression, mode="eval")))
+    return compile(tree, formula, "eval")
+
+
+def _labelled_cells(sheet):
+    """Map the cell to the right of each label in a sheet to the label's qud_* parameter name"""
+    labelled = {}
+    for row in sheet.iter_rows():
+        for cell in row:
+            if isinstance(cell.value, str) and cell.value.strip() in SPREADSHEET_LABELS:
+                labelled[sheet.cell(cell.row, cell.column + 1).coordinate] = SPREADSHEET_LABELS[cell.value.strip()]
+    return labelled
+
+
+def _is_formula(value):
+    return isinstance(value, str) and bool(CELL_REFERENCE.search(value))
+
+
+def evaluate_sheet(sheet, inputs: dict):
+    """Evaluate the formulas of a calculation sheet with the workbook's inputs replaced by arrays
+
+    Labelled quantities holding a formula are outputs, and other labelled
+    quantities, on any sheet of the workbook, are inputs.  Sheets without
+    labels may instead be tables with a header row of SPREADSHEET_COLUMNS and
+    one formula per row, whose columns gain a leading axis of rows.  The KD
+    column of a table is an input to its other columns.
+
+    Args:
+        sheet (Worksheet): Calculation sheet from quDSimulation_v1.xlsx
+        inputs (dict): Arrays for each qud_* parameter name
+
+    Returns:
+        tuple: Dicts of arrays for the sheet's input quantities, and for each
+            quantity computed by a formula, both empty if the sheet has neither
+    """
+    workbook = sheet.parent
+    labels = {worksheet.title: _labelled_cells(worksheet) for worksheet in workbook.worksheets}
+    cache = {}
+
+    def cell(sheet_name, coordinate):
+        if (sheet_name, coordinate) not in cache:
+            value = workbook[sheet_name][coordinate].value
+            if coordinate in labels[sheet_name] and not _is_formula(value):
+                value = inputs[labels[sheet_name][coordinate]]
+            elif isinstance(value, str):
+                code = excel_formula_to_python(value, sheet_name)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    value = eval(code, {'cell': cell, 'power': np.power, 'sqrt': np.sqrt})
+            cache[sheet_name, coordinate] = value
+        return cache[sheet_name, coordinate]
+
+    labelled = labels[sheet.title]
+    if labelled:
+        sheet_inputs = {name: inputs[name] for coordinate, name in labelled.items() if not _is_formula(sheet[coordinate].value)}
+        outputs = {name: cell(sheet.title, coordinate) for coordinate, name in labelled.items() if _is_formula(sheet[coordinate].value)}
+        return sheet_inputs, outputs
+
+    columns = {header.column_letter: SPREADSHEET_COLUMNS[header.value.strip()] for header in sheet[1]
+               if isinstance(header.value, str) and header.value.strip() in SPREADSHEET_COLUMNS}
+    rows = [np.broadcast_arrays(*(cell(sheet.title, f"{letter}{row}") for letter in columns))
+            for row in range(2, sheet.max_row + 1)]
+    table = {name: np.stack([row[i] for row in rows]) for i, name in enumerate(columns.values())}
+    sheet_inputs = {'kdtl': table.pop('kdtl')} if 'kdtl' in table else {}
+    return sheet_inputs, table
+
+
+def cross_check_spreadsheet(path: Path, grid: dict):
+    """Compare every formula in the spreadsheet's calculation sheets to the Python functions
+
+    Observed lred, lwhite and pt inputs are simulated on the grid with the
+    Python forward functions.  KDs are compared to the inverse function taking
+    the observation present on the same sheet, and table columns to the
+    forward functions at the KDs of the table.  A point where only one of the
+    spreadsheet and Python gives a finite result has an infinite difference.
+
+    Args:
+        path (Path): Path to quDSimulation_v1.xlsx
+        grid (dict): Arrays for t0, l0, kdtl, redvol, whitevol and pc, broadcasting to the grid
+
+    Returns:
+        tuple: List of tuples of sheet name, quantity, maximum relative difference, the number of points
+            differing by more than CROSS_CHECK_TOLERANCE and the number compared, and the names of
+            sheets with no formulas to compare
+    """
+    from openpyxl import load_workbook
+    inputs = dict(grid)
+    for name, func in sweep_columns.items():
+        inputs[name] = func(**grid)
+    inverses = {'lred': qud_Kd_from_lred, 'lwhite': qud_Kd_from_lwhite, 'pt': qud_Kd_from_pt}
+    results = []
+    skipped = []
+    for sheet in load_workbook(path).worksheets:
+        sheet_inputs, outputs = evaluate_sheet(sheet, inputs)
+        if not outputs:
+            skipped.append(sheet.title)
+        for name, spreadsheet_values in outputs.items():
+            if name == 'kdtl':
+                func = inverses[next(o for o in inverses if o in sheet_inputs)]
+            else:
+                func = sweep_columns[name]
+            args = {p: sheet_inputs.get(p, inputs[p]) for p in inspect.signature(func).parameters}
+            with np.errstate(invalid='ignore', divide='ignore'):
+                python_values = np.broadcast_to(func(**args), np.shape(spreadsheet_values))
+                difference = np.abs(spreadsheet_values - python_values) / np.abs(python_values)
+            agree = (spreadsheet_values == python_values) | (np.isnan(spreadsheet_values) & np.isnan(python_values))
+            difference[agree] = 0.0
+            difference[np.isnan(difference)] = np.inf
+            results.append((sheet.title, name, np.max(difference, initial=0.0),
+                            np.count_nonzero(difference > CROSS_CHECK_TOLERANCE), difference.size))
+    return results, skipped
+
+
+OUTPUT_DIRECTORY.mkdir(exist_ok=True)
+for table_name, columns, params in [("qud_sweep", sweep_columns, sweep_parameters),
+                                    ("qud_batch_kd", batch_kd_columns, batch_kd_parameters)]:
+    metadata = table_metadata(columns, **params)
+    for file_format in FORMATS:
+        path = OUTPUT_DIRECTORY / f"{table_name}.{file_format}"
+        WRITERS[file_format](path, table_chunks(columns, CHUNK_SIZE, **params), metadata)
+        print(f"Wrote {np.prod(metadata['grid_shape'])} rows to {path}")
+
+if CROSS_CHECK:
+    cross_check_grid = {
+        'kdtl': np.geomspace(0.1, 1e4, 50)[:, None, None, None, None, None],
+        't0': np.geomspace(1, 1e3, 20)[None, :, None, None, None, None],
+        'l0': np.geomspace(1, 1e3, 20)[None, None, :, None, None, None],
+        'redvol': np.array([50, 100, 200])[None, None, None, :, None, None],
+        'whitevol': np.array([100, 300, 900])[None, None, None, None, :, None],
+        'pc': np.linspace(0.8, 1.2, 5),
+    }
+    print()
+    print(f"Cross-check against {SPREADSHEET.name}")
+    print("*" * len(f"Cross-check against {SPREADSHEET.name}"))
+    results, skipped = cross_check_spreadsheet(SPREADSHEET, cross_check_grid)
+    failed = False
+    for sheet_name, name, difference, n_mismatched, n_compared in results:
+        status = "ok" if difference <= CROSS_CHECK_TOLERANCE else "MISMATCH"
+        failed |= not difference <= CROSS_CHECK_TOLERANCE
+        print(f"{sheet_name:>20} {name:>7}: maximum relative difference {difference:.1e}, "
+              f"{n_mismatched} of {n_compared} points mismatched {status}")
+    print(f"Sheets with no formulas to compare: {', '.join(skipped) or 'none'}")
+    sys.exit(1 if failed else 0)
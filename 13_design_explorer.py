@@ -0,0 +1,215 @@
+"""
+Interactively explore qµD assay designs
+
+Sliders set t0, l0, the chamber volumes and pc, and the red and white chamber
+concentrations and pt are redrawn as a function of KD.  Curves are served from
+a cache of precomputed tiles, one tile per slider setting.  When a tile is
+missing, recomputation is debounced until the sliders settle and then runs on a
+background worker, which computes in one vectorized call every tile reachable
+by moving a single slider from the requested setting.
+"""
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib import pyplot as plt
+from matplotlib.widgets import Slider
+import numpy as np
+from microdialysis_equations import *
+
+# We can choose to work in a common unit, typically nM, or uM, as long as all
+# numbers are in the same unit, the result is valid.  We assume uM for all
+# concentrations bellow.  If uM is used for concentrations, then ul should be
+# used as the standard unit for volume etc.
+
+#  - SLIDERS gives, for each parameter, the values its slider snaps to and
+#     its initial value.  A tile holds the curves for one combination.
+#  - CACHE_TILES is the most tiles held in the cache, each taking
+#     3 x NUM_POINTS_ON_XAXIS x 8 bytes.
+#  - DEBOUNCE_MS is how long the sliders must be still before missing tiles
+#     are computed, and POLL_MS how often the background worker is checked.
+
+KD_beginning = 0
+KD_end = 500
+NUM_POINTS_ON_XAXIS = 1000
+SLIDERS = {
+    't0': (np.arange(1, 201), 80),
+    'l0': (np.arange(1, 201), 50),
+    'redvol': (np.arange(50, 501, 10), 100),
+    'whitevol': (np.arange(50, 1001, 10), 300),
+    'pc': (np.round(np.arange(0.5, 2.001, 0.01), 2), 1.0),
+}
+CACHE_TILES = 5000
+DEBOUNCE_MS = 150
+POLL_MS = 20
+
+x_axis = np.linspace(KD_beginning, KD_end, NUM_POINTS_ON_XAXIS)
+
+
+def compute_tiles(key: tuple, cached):
+    """Compute the tiles reachable from key by moving a single slider
+
+    Args:
+        key (tuple): Slider values, in the order of SLIDERS
+        cached (callable): Returns True for keys already in the cache
+
+    Returns:
+        dict: Tile keys mapped to (3, NUM_POINTS_ON_XAXIS) arrays of lred, lwhite and pt
+    """
+    keys = []
+    for i, (values, _) in enumerate(SLIDERS.values()):
+        keys += [k for k in (key[:i] + (v,) + key[i + 1:] for v in values.tolist()) if not cached(k)]
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    params = {name: np.array([k[i] for k in keys], dtype=float)[:, None] for i, name in enumerate(SLIDERS)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lred = qud_lred(kdtl=x_axis, **params)
+        lwhite = qud_lwhite(kdtl=x_axis, **params)
+        pt = lred / lwhite
+    return {k: np.stack([lred[i], lwhite[i], pt[i]]) for i, k in enumerate(keys)}
+
+
+def axis_limit(values: np.ndarray):
+    """Round the largest finite value up to a 1, 2, 5 x 10^n axis limit, so limits rarely change"""
+    largest = np.max(values, where=np.isfinite(values), initial=1.0)
+    decade = 10**np.floor(np.log10(largest))
+    return next(step * decade for step in (1, 2, 5, 10) if step * decade >= largest)
+
+
+class DesignExplorer:
+    """Slider-driven plot of the tile for the current slider settings
+
+    Curves are redrawn by blitting over a saved background, taking around
+    ten milliseconds.  Axis limits are rounded so that they rarely change, and a
+    full redraw of the figure is only needed when they do.  The status line
+    shows the time taken by the previous update, from the slider moving to
+    the redrawn plot, as the status text is itself part of the redraw.
+    """
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        self.backgrounds = None
+        self.full_redraw_requested = None
+        self.redraw_ms = None
+        self.full_redraw = False
+
+        self.fig = plt.figure(figsize=(7.204724, 8))
+        self.fig.suptitle("qµD design explorer", y=0.98, fontsize=14)
+        self.ax_conc = self.fig.add_axes((0.12, 0.62, 0.83, 0.32))
+        self.ax_pt = self.fig.add_axes((0.12, 0.30, 0.83, 0.25), sharex=self.ax_conc)
+        self.red_line, = self.ax_conc.plot(x_axis, np.full_like(x_axis, np.nan), 'r-', label='Red chamber', animated=True)
+        self.white_line, = self.ax_conc.plot(x_axis, np.full_like(x_axis, np.nan), 'k-', label='White chamber', animated=True)
+        self.pt_line, = self.ax_pt.plot(x_axis, np.full_like(x_axis, np.nan), 'k', label='System', animated=True)
+        self.status = self.ax_conc.text(0.01, 0.97, "", transform=self.ax_conc.transAxes, va='top', fontsize=9, animated=True)
+        self.ax_conc.set_ylabel(r"[Compound] (µM)", fontsize=12)
+        self.ax_pt.set_ylabel("$p_t$", fontsize=12)
+        self.ax_pt.set_xlabel(r"Compound K$_\mathrm{D}$ (µM)", fontsize=12)
+        self.ax_conc.set_xlim(KD_beginning, KD_end)
+        for ax in (self.ax_conc, self.ax_pt):
+            ax.grid()
+            ax.legend(loc='lower right')
+
+        self.sliders = {}
+        for i, (name, (values, initial)) in enumerate(SLIDERS.items()):
+            ax = self.fig.add_axes((0.2, 0.2 - i * 0.04, 0.65, 0.025))
+            self.sliders[name] = Slider(ax, name, values[0], values[-1], valinit=initial, valstep=values)
+            self.sliders[name].drawon = False
+            self.sliders[name].on_changed(lambda _, name=name: self.on_changed(name))
+
+        self.debounce_timer = self.fig.canvas.new_timer(interval=DEBOUNCE_MS)
+        self.debounce_timer.single_shot = True
+        self.debounce_timer.add_callback(self.submit)
+        self.poll_timer = self.fig.canvas.new_timer(interval=POLL_MS)
+        self.poll_timer.add_callback(self.poll)
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+        self.store(compute_tiles(self.key(), self.cache.__contains__))
+        self.show_tile(time.perf_counter())
+
+    def key(self):
+        return tuple(float(slider.val) for slider in self.sliders.values())
+
+    def store(self, tiles: dict):
+        self.cache.update(tiles)
+        while len(self.cache) > CACHE_TILES:
+            self.cache.popitem(last=False)
+
+    def on_changed(self, name: str):
+        start = time.perf_counter()
+        slider_ax = self.sliders[name].ax
+        if self.backgrounds is not None:
+            self.fig.draw_artist(slider_ax)
+            self.fig.canvas.blit(slider_ax.bbox)
+        if self.key() in self.cache:
+            self.show_tile(start)
+        else:
+            self.status.set_text("Computing...")
+            self.blit()
+            self.debounce_timer.stop()
+            self.debounce_timer.start()
+
+    def submit(self):
+        if self.pending is None:
+            self.pending = self.executor.submit(compute_tiles, self.key(), self.cache.__contains__)
+            self.poll_timer.start()
+
+    def poll(self):
+        if self.pending is None or not self.pending.done():
+            return
+        self.poll_timer.stop()
+        self.store(self.pending.result())
+        self.pending = None
+        if self.key() in self.cache:
+            self.show_tile(time.perf_counter())
+        else:
+            # The sliders moved on whilst the worker was busy
+            self.submit()
+
+    def status_text(self):
+        if self.redraw_ms is None:
+            return f"{len(self.cache)} tiles cached"
+        return f"Previous redraw {self.redraw_ms:.1f} ms{' (full)' if self.full_redraw else ''}, {len(self.cache)} tiles cached"
+
+    def show_tile(self, start: float):
+        """Show the tile for the current slider settings, timing the update from start"""
+        key = self.key()
+        tile = self.cache[key]
+        self.cache.move_to_end(key)
+        self.red_line.set_ydata(tile[0])
+        self.white_line.set_ydata(tile[1])
+        self.pt_line.set_ydata(tile[2])
+        limits = (axis_limit(tile[:2]), axis_limit(tile[2]))
+        if self.backgrounds is None or limits != (self.ax_conc.get_ylim()[1], self.ax_pt.get_ylim()[1]):
+            self.ax_conc.set_ylim(0, limits[0])
+            self.ax_pt.set_ylim(0, limits[1])
+            self.full_redraw_requested = start
+            self.fig.canvas.draw_idle()
+            return
+        self.status.set_text(self.status_text())
+        self.blit()
+        self.redraw_ms, self.full_redraw = (time.perf_counter() - start) * 1000, False
+
+    def blit(self):
+        if self.backgrounds is None:
+            return
+        for ax, background in zip((self.ax_conc, self.ax_pt), self.backgrounds):
+            self.fig.canvas.restore_region(background)
+            for artist in ax.get_children():
+                if artist.get_animated():
+                    ax.draw_artist(artist)
+            self.fig.canvas.blit(ax.bbox)
+
+    def on_draw(self, _):
+        self.backgrounds = [self.fig.canvas.copy_from_bbox(ax.bbox) for ax in (self.ax_conc, self.ax_pt)]
+        self.status.set_text(self.status_text())
+        self.blit()
+        if self.full_redraw_requested is not None:
+            self.redraw_ms, self.full_redraw = (time.perf_counter() - self.full_redraw_requested) * 1000, True
+            self.full_redraw_requested = None
+
+
+if __name__ == "__main__":
+    explorer = DesignExplorer()
+    plt.show()
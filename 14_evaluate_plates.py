@@ -0,0 +1,156 @@
+"""
+Evaluate whole 96/384-well plates
+
+Simulate and analyse a stack of plates in single vectorized calls, with
+per-well volumes, protein and compound concentrations.  A well map assigns
+each well a compound and a role: control wells contain no protein and define
+pc for their compound, sample wells contain protein and give KD.  pc is
+taken from each plate's own control wells in the same pass that derives KDs
+from the sample wells.
+"""
+import string
+import time
+import numpy as np
+from microdialysis_equations import *
+
+# We can choose to work in a common unit, typically nM, or uM, as long as all
+# numbers are in the same unit, the result is valid.  We assume uM for all
+# concentrations bellow.  If uM is used for concentrations, then ul should be
+# used as the standard unit for volume etc.
+
+#  - PLATE_FORMAT is 96 or 384 wells.
+#  - N_PLATES is the number of plates in the stack, each with its own protein
+#     lot (t0) and per-well volumes and compound concentrations.
+#  - N_CONTROL_WELLS and N_SAMPLE_WELLS are the wells per compound without and
+#     with protein.
+#  - MEASUREMENT_ERROR is the relative standard deviation of simulated
+#     lred and lwhite measurements.
+
+PLATE_FORMATS = {96: (8, 12), 384: (16, 24)}
+PLATE_FORMAT = 384
+N_PLATES = 500
+N_CONTROL_WELLS = 2
+N_SAMPLE_WELLS = 4
+MEASUREMENT_ERROR = 0.005
+
+ROLE_EMPTY = 0
+ROLE_CONTROL = 1
+ROLE_SAMPLE = 2
+ROLES = {'empty': ROLE_EMPTY, 'control': ROLE_CONTROL, 'sample': ROLE_SAMPLE}
+
+
+def well_names(plate_format: int):
+    """Name the wells of a plate, A1, A2, ... in row-major order"""
+    n_rows, n_cols = PLATE_FORMATS[plate_format]
+    return [f"{string.ascii_uppercase[r]}{c + 1}" for r in range(n_rows) for c in range(n_cols)]
+
+
+def layout_from_well_map(well_map: dict, plate_format: int):
+    """Convert a well map to per-well role and compound arrays
+
+    Args:
+        well_map (dict): Well names mapped to (role, compound) tuples, where role
+            is "control" or "sample".  Wells not in the map are empty.
+        plate_format (int): 96 or 384
+
+    Returns:
+        tuple: Role and compound index arrays, one element per well, compound -1 for empty wells
+    """
+    names = well_names(plate_format)
+    role = np.full(len(names), ROLE_EMPTY, dtype=np.int8)
+    compound = np.full(len(names), -1)
+    for i, name in enumerate(names):
+        if name in well_map:
+            role[i] = ROLES[well_map[name][0]]
+            compound[i] = well_map[name][1]
+    return role, compound
+
+
+def evaluate_plates(lred, lwhite, role, compound, t0, l0, redvol, whitevol):
+    """Derive pc and KD for every compound on a stack of plates in one pass
+
+    pc for each compound on each plate is the mean lred/lwhite of its control
+    wells on that plate, and is applied to its sample wells to derive KDs from
+    lwhite.  Parameters are arrays of shape (n_plates, n_wells), or broadcast
+    to it.
+
+    Args:
+        lred (np.ndarray): Measured compound concentration in the red chamber
+        lwhite (np.ndarray): Measured compound concentration in the white chamber
+        role (np.ndarray): Role of each well, ROLE_EMPTY, ROLE_CONTROL or ROLE_SAMPLE
+        compound (np.ndarray): Compound index of each well, -1 for empty wells
+        t0 (np.ndarray): Target concentration (in the red chamber)
+        l0 (np.ndarray): Ligand concentration, over the entire volume of red and white chambers when fully equilibrated.
+        redvol (np.ndarray): Volume of the red chamber
+        whitevol (np.ndarray): Volume of the white chamber
+
+    Returns:
+        tuple: pc and mean KD arrays of shape (n_plates, n_compounds), and the per-well KD array
+    """
+    shape = np.broadcast_shapes(np.shape(lred), np.shape(role))
+    role = np.broadcast_to(role, shape)
+    compound = np.broadcast_to(compound, shape)
+    n_compounds = compound.max() + 1
+    group = np.arange(shape[0])[:, None] * n_compounds + compound
+    control = role == ROLE_CONTROL
+    sample = role == ROLE_SAMPLE
+
+    n_groups = shape[0] * n_compounds
+    # Compounds without control or sample wells on a plate are given NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pc = (np.bincount(group[control], weights=(lred / lwhite)[control], minlength=n_groups) /
+              np.bincount(group[control], minlength=n_groups))
+        well_pc = np.where(compound >= 0, pc[np.maximum(group, 0)], np.nan)
+        well_kd = np.where(sample, qud_Kd_from_lwhite(lwhite, t0, l0, redvol, whitevol, well_pc), np.nan)
+        kd = (np.bincount(group[sample], weights=well_kd[sample], minlength=n_groups) /
+              np.bincount(group[sample], minlength=n_groups))
+    return pc.reshape(shape[0], n_compounds), kd.reshape(shape[0], n_compounds), well_kd
+
+
+# Compounds fill the plate in blocks of control then sample wells, leaving
+# any remaining wells empty.
+wells_per_compound = N_CONTROL_WELLS + N_SAMPLE_WELLS
+names = well_names(PLATE_FORMAT)
+n_compounds = len(names) // wells_per_compound
+well_map = {name: ("control" if i % wells_per_compound < N_CONTROL_WELLS else "sample", i // wells_per_compound)
+            for i, name in enumerate(names[:n_compounds * wells_per_compound])}
+role, compound = layout_from_well_map(well_map, PLATE_FORMAT)
+
+# Simulate the stack of plates, each plate with its own protein lot, and
+# per-well pipetting variation in volumes and compound concentration
+rng = np.random.default_rng(0)
+n_wells = len(names)
+true_kd = 10**rng.uniform(0, 3, (N_PLATES, n_compounds))
+true_pc = rng.uniform(0.9, 1.1, (N_PLATES, n_compounds))
+t0_lot = rng.uniform(60, 100, (N_PLATES, 1))
+t0 = np.where(role == ROLE_SAMPLE, t0_lot, 0.0)
+l0 = 50 * rng.normal(1, 0.02, (N_PLATES, n_wells))
+redvol = 100 * rng.normal(1, 0.02, (N_PLATES, n_wells))
+whitevol = 300 * rng.normal(1, 0.02, (N_PLATES, n_wells))
+well_true_kd = true_kd[:, np.maximum(compound, 0)]
+well_true_pc = true_pc[:, np.maximum(compound, 0)]
+
+start = time.perf_counter()
+lred = qud_lred(t0, l0, well_true_kd, redvol, whitevol, well_true_pc)
+lwhite = qud_lwhite(t0, l0, well_true_kd, redvol, whitevol, well_true_pc)
+simulation_time = time.perf_counter() - start
+lred *= rng.normal(1, MEASUREMENT_ERROR, lred.shape)
+lwhite *= rng.normal(1, MEASUREMENT_ERROR, lwhite.shape)
+
+start = time.perf_counter()
+pc, kd, well_kd = evaluate_plates(lred, lwhite, role, compound, t0, l0, redvol, whitevol)
+evaluation_time = time.perf_counter() - start
+
+print(f"{N_PLATES} {PLATE_FORMAT}-well plates, {n_compounds} compounds per plate")
+print(f"Simulated in {simulation_time * 1000:.1f} ms, evaluated in {evaluation_time * 1000:.1f} ms")
+relative_error = np.abs(kd - true_kd) / true_kd
+print(f"Median relative KD error {np.nanmedian(relative_error):.3f}, "
+      f"median relative pc error {np.median(np.abs(pc - true_pc) / true_pc):.4f}")
+
+print()
+print("First plate")
+print("***********")
+print(f"{'compound':>10},{'wells':>10},{'pc':>8},{'true pc':>8},{'KD':>10},{'true KD':>10}")
+for c in range(n_compounds):
+    wells = [name for name, (_, i) in well_map.items() if i == c]
+    print(f"{c:>10},{wells[0] + '-' + wells[-1]:>10},{pc[0, c]:>8.3f},{true_pc[0, c]:>8.3f},{kd[0, c]:>10.2f},{true_kd[0, c]:>10.2f}")
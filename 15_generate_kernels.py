@@ -0,0 +1,276 @@
+"""
+Generate optimized qµD kernels
+
+Derive the qµD forward solutions, their inverses and all of their partial
+derivatives symbolically from the mass-balance equations, then apply Horner
+factoring and common-subexpression elimination and write the result to
+microdialysis_kernels.py as NumPy functions.  The generated kernels are
+checked against microdialysis_equations.py, and the derivatives against
+complex-step derivatives, and the operation count and run time of each kernel is
+compared to the original.  The module is only written if every check passes.  Requires the sympy package.
+"""
+import ast
+import inspect
+import sys
+import time
+import types
+from pathlib import Path
+import numpy as np
+import sympy as sp
+from sympy.printing.numpy import NumPyPrinter
+import microdialysis_equations
+
+# The system is described by:
+#  - lwhite, the free compound concentration in the white chamber.  The free
+#     compound concentration in the red chamber is pc*lwhite.
+#  - c, the target-compound complex concentration in the red chamber, with
+#     kdtl = pc*lwhite*(t0 - c)/c.
+#  - Conservation of compound, l0*(redvol + whitevol) =
+#     whitevol*lwhite + redvol*(pc*lwhite + c), with lred = pc*lwhite + c.
+#
+#  - OUTPUT is the generated module.
+#  - Kernels are checked on N_SAMPLES random systems against
+#     microdialysis_equations.py evaluated in extended precision.  A kernel
+#     passes if its 99.9th percentile relative error is below CHECK_TOLERANCE,
+#     or no more than ten times that of the original function.  Derivatives
+#     are checked against complex-step derivatives of the original, to within
+#     DERIVATIVE_TOLERANCE in extended precision, and in double precision to
+#     within ten times the error of the original's own complex-step
+#     derivatives.
+
+OUTPUT = Path(__file__).with_name("microdialysis_kernels.py")
+CHECK_TOLERANCE = 1e-12
+DERIVATIVE_TOLERANCE = 1e-7
+N_SAMPLES = 1_000_000
+
+t0, l0, kdtl, redvol, whitevol, pc = sp.symbols('t0 l0 kdtl redvol whitevol pc', positive=True)
+lred, lwhite, pt = sp.symbols('lred lwhite pt', positive=True)
+
+
+# Reference system used to pick the physically meaningful root of each quadratic
+REFERENCE_SYSTEM = {t0: 80, l0: 50, kdtl: 100, redvol: 100, whitevol: 300, pc: sp.Rational(11, 10)}
+
+
+def kd_from_free(free_white, red_total):
+    """KD given the free white chamber and total red chamber compound concentrations"""
+    complex_conc = red_total - pc * free_white
+    return pc * free_white * (t0 - complex_conc) / complex_conc
+
+
+def horner_factor(expr):
+    """Rewrite the polynomial parts of an expression in whichever of expanded, Horner or factored form is shortest"""
+    if expr.is_Atom:
+        return expr
+    if expr.is_polynomial() and expr.free_symbols:
+        expanded = sp.expand(expr)
+        return min([expr, expanded, sp.horner(expanded), sp.factor(expanded)], key=sp.count_ops)
+    return expr.func(*(horner_factor(arg) for arg in expr.args))
+
+
+def physical_root(polynomial, observation):
+    """Solve a quadratic for an observation, choosing the root giving a free white chamber
+    concentration above zero and a complex concentration between zero and t0 in REFERENCE_SYSTEM"""
+    a, b, c = (horner_factor(coefficient) for coefficient in sp.Poly(polynomial, observation).all_coeffs())
+    discriminant = b**2 - 4 * a * c
+    for root in ((-b + sp.sqrt(discriminant)) / (2 * a), (-b - sp.sqrt(discriminant)) / (2 * a)):
+        free_white, red_total = free_concentrations(observation, root.subs(REFERENCE_SYSTEM))
+        complex_conc = red_total - pc * free_white
+        if free_white.subs(REFERENCE_SYSTEM) > 0 and 0 < complex_conc.subs(REFERENCE_SYSTEM) < t0.subs(REFERENCE_SYSTEM):
+            return root
+    raise ValueError(f"No physical root for {observation}")
+
+
+def free_concentrations(observation, value):
+    """Free white chamber and total red chamber compound concentrations implied by an observation, by conservation of compound"""
+    total = l0 * (redvol + whitevol)
+    if observation == lwhite:
+        return value, (total - whitevol * value) / redvol
+    if observation == lred:
+        return (total - redvol * value) / whitevol, value
+    free_white = total / (whitevol + redvol * value)
+    return free_white, value * free_white
+
+
+def derive_equations():
+    """Derive each qud_* function as a sympy expression, keyed by function name
+
+    The inverses follow directly from the binding equation and conservation
+    of compound.  Setting each inverse equal to kdtl gives a quadratic in the
+    observation, whose physical root is the forward solution.
+
+    Returns:
+        dict: Function names mapped to (argument symbols, expression)
+    """
+    forward_args = (t0, l0, kdtl, redvol, whitevol, pc)
+    equations = {}
+    for observation in (lred, lwhite, pt):
+        inverse = kd_from_free(*free_concentrations(observation, observation))
+        quadratic = sp.numer(sp.together(inverse - kdtl))
+        equations[f"qud_{observation}"] = (forward_args, physical_root(quadratic, observation))
+        equations[f"qud_Kd_from_{observation}"] = ((observation, t0, l0, redvol, whitevol, pc), sp.factor(inverse))
+    return {name: equations[name] for name in ('qud_lred', 'qud_lwhite', 'qud_pt', 'qud_Kd_from_pt', 'qud_Kd_from_lred', 'qud_Kd_from_lwhite')}
+
+
+def optimise(expressions: list):
+    """Horner factor and eliminate common subexpressions across a list of expressions
+
+    Returns:
+        tuple: List of (temporary symbol, expression) assignments, and the reduced expressions
+    """
+    return sp.cse([horner_factor(e) for e in expressions], symbols=sp.numbered_symbols('x'), optimizations='basic')
+
+
+class _KernelPrinter(NumPyPrinter):
+    """Print sqrt and powers without a module prefix, as in microdialysis_equations.py"""
+
+    def _print_Pow(self, expr, rational=False):
+        if expr.exp == sp.S.Half:
+            return f"sqrt({self._print(expr.base)})"
+        if expr.exp == -1:
+            return f"1/{self.parenthesize(expr.base, 1000)}"
+        return super()._print_Pow(expr, rational)
+
+    def _print_Function(self, expr):
+        return f"{expr.func.__name__}({', '.join(self._print(a) for a in expr.args)})"
+
+
+def emit_function(name: str, args: tuple, assignments: list, results: list, docstring: str):
+    printer = _KernelPrinter({'fully_qualified_modules': False, 'inline': True})
+    lines = [f"def {name}({', '.join(f'{a}: float' for a in args)}):", f'    """{docstring}"""']
+    lines += [f"    {symbol} = {printer.doprint(expr)}" for symbol, expr in assignments]
+    if len(results) == 1:
+        lines.append(f"    return {printer.doprint(results[0])}")
+    else:
+        lines.append("    return {" + ", ".join(f"'{a}': {printer.doprint(r)}" for a, r in zip(args, results)) + "}")
+    return "\n".join(lines)
+
+
+def generate_module(equations: dict):
+    """Generate the source of microdialysis_kernels.py"""
+    functions = []
+    for name, (args, expr) in equations.items():
+        summary = inspect.getdoc(getattr(microdialysis_equations, name)).splitlines()[0]
+        assignments, (result,) = optimise([expr])
+        functions.append(emit_function(name, args, assignments, [result],
+                                       f"{summary}\n\n    Generated equivalent of microdialysis_equations.{name}, see its\n"
+                                       f"    docstring for arguments.\n    "))
+        partials = [sp.diff(expr, a) for a in args]
+        assignments, results = optimise(partials)
+        functions.append(emit_function(f"{name}_derivatives", args, assignments, results,
+                                       f"Partial derivatives of {name} with respect to each argument\n\n"
+                                       f"    Returns:\n        dict: Argument names mapped to partial derivatives\n    "))
+    header = ('"""\nOptimized qµD kernels\n\nGenerated by 15_generate_kernels.py from the qµD mass-balance equations.  Do\n'
+              'not edit by hand, rerun the generator instead.\n"""\nfrom numpy import sqrt\n')
+    return header + "\n\n" + "\n\n\n".join(functions) + "\n"
+
+
+def count_operations(source: str, name: str):
+    """Count the arithmetic operations and function calls in a function defined in module source"""
+    function = next(node for node in ast.parse(source).body if isinstance(node, ast.FunctionDef) and node.name == name)
+    return sum(isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Call)) for node in ast.walk(function))
+
+
+def sample_arguments(rng, args: tuple, n: int):
+    """Random physically valid arguments for a qud_* function"""
+    system = {
+        't0': 10**rng.uniform(-1, 3, n), 'l0': 10**rng.uniform(-1, 3, n), 'kdtl': 10**rng.uniform(-2, 4, n),
+        'redvol': 10**rng.uniform(1, 3, n), 'whitevol': 10**rng.uniform(1, 3, n), 'pc': rng.uniform(0.5, 2.0, n),
+    }
+    for observation in ('lred', 'lwhite', 'pt'):
+        system[observation] = getattr(microdialysis_equations, f"qud_{observation}")(
+            **{a: system[a] for a in ('t0', 'l0', 'kdtl', 'redvol', 'whitevol', 'pc')})
+    return {str(a): system[str(a)] for a in args}
+
+
+def relative_difference(a, b):
+    """Relative difference of a from b, infinite where only one is NaN or the difference is otherwise
+    not finite, and zero where they agree, as in 11_verify_round_trips.py"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difference = np.abs(a - b) / np.abs(b)
+    both_nan = np.isnan(a) & np.isnan(b)
+    difference[~both_nan & ~np.isfinite(difference)] = np.inf
+    difference[both_nan | (a == b)] = 0.0
+    return difference
+
+
+def complex_step_derivative(func, params: dict, arg: str, dtype):
+    """Partial derivative of func with respect to arg by the complex-step method, evaluated in dtype"""
+    complex_params = {a: v.astype(dtype) for a, v in params.items()}
+    step = np.abs(params[arg]) * 1e-30
+    return func(**{**complex_params, arg: complex_params[arg] + 1j * step}).imag / step
+
+
+def error_percentile(difference):
+    """99.9th percentile of relative differences, taken without interpolation so infinities are kept"""
+    return np.percentile(difference, 99.9, method='higher')
+
+
+def best_time(func, params: dict, repeats: int = 5):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(**params)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# The kernels are checked in memory, and only written to OUTPUT if they pass
+equations = derive_equations()
+source = generate_module(equations)
+microdialysis_kernels = types.ModuleType(OUTPUT.stem)
+exec(compile(source, OUTPUT.name, "exec"), microdialysis_kernels.__dict__)
+original_source = inspect.getsource(microdialysis_equations)
+
+rng = np.random.default_rng(0)
+failed = False
+print()
+print("Relative errors are against microdialysis_equations.py evaluated in extended precision (np.longdouble)")
+print(f"{'function':>20},{'ops before':>11},{'ops after':>10},{'time before':>12},{'time after':>11},{'speedup':>8},"
+      f"{'error before':>13},{'error after':>12},{'deriv ext':>12},{'deriv before':>13},{'deriv after':>12}")
+for name, (args, _) in equations.items():
+    original = getattr(microdialysis_equations, name)
+    kernel = getattr(microdialysis_kernels, name)
+    derivatives = getattr(microdialysis_kernels, f"{name}_derivatives")
+    params = sample_arguments(rng, args, N_SAMPLES)
+    extended = {a: v.astype(np.longdouble) for a, v in params.items()}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reference = original(**extended)
+        error_before = error_percentile(relative_difference(original(**params), reference))
+        error_after = error_percentile(relative_difference(kernel(**params), reference))
+        # Derivatives are compared to complex-step derivatives of the original
+        # in extended precision, which unlike finite differences do not lose
+        # accuracy to cancellation.  Evaluated in extended precision they must
+        # agree to DERIVATIVE_TOLERANCE, and in double precision be no more
+        # than ten times as far from them as double precision complex-step
+        # derivatives of the original, which share its conditioning.
+        derivative_ok = True
+        extended_errors, double_errors_before, double_errors_after = [], [], []
+        extended_partials = derivatives(**extended)
+        double_partials = derivatives(**params)
+        for arg in map(str, args):
+            reference_partial = complex_step_derivative(original, extended, arg, np.clongdouble)
+            double_before = error_percentile(relative_difference(complex_step_derivative(original, params, arg, np.complex128),
+                                                                 reference_partial))
+            double_after = error_percentile(relative_difference(double_partials[arg], reference_partial))
+            extended_errors.append(error_percentile(relative_difference(extended_partials[arg], reference_partial)))
+            double_errors_before.append(double_before)
+            double_errors_after.append(double_after)
+            derivative_ok &= bool(np.isfinite(double_after) and double_after <= max(10 * double_before, CHECK_TOLERANCE))
+        derivative_error = np.max(extended_errors)
+    time_before = best_time(original, params)
+    time_after = best_time(kernel, params)
+    # Written so that NaN or infinite errors fail
+    ok = (np.isfinite(error_after) and error_after <= max(10 * error_before, CHECK_TOLERANCE)
+          and derivative_error <= DERIVATIVE_TOLERANCE and derivative_ok)
+    failed |= not ok
+    print(f"{name:>20},{count_operations(original_source, name):>11},{count_operations(source, name):>10},{time_before * 1000:>10.1f}ms,"
+          f"{time_after * 1000:>9.1f}ms,{time_before / time_after:>8.2f},{error_before:>13.1e},{error_after:>12.1e},"
+          f"{derivative_error:>12.1e},{np.max(double_errors_before):>13.1e},{np.max(double_errors_after):>12.1e}"
+          f"{'' if ok else ' FAILED'}")
+
+print()
+if failed:
+    print(f"Checks failed, {OUTPUT.name} was not written")
+    sys.exit(1)
+OUTPUT.write_text(source, encoding="utf-8")
+print(f"Wrote {OUTPUT.name}")
@@ -1,5 +1,8 @@
 #from numpy import sqrt
 from numpy import sqrt
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 
 def qud_lred(t0: float, l0: float, kdtl: float, redvol: float, whitevol: float, pc: float):
@@ -120,3 +123,307 @@ def qud_Kd_from_lwhite(lwhite: float, t0: float, l0: float, redvol: float, white
         float: Kd of the target-ligand interaction
     """
     return -((lwhite*(l0*pc*redvol - lwhite*pc**2*redvol - pc*redvol*t0 + l0*pc*whitevol - lwhite*pc*whitevol))/(l0*redvol - lwhite*pc*redvol + l0*whitevol - lwhite*whitevol))
+
+
+# Rough peak memory, in bytes, used per element while evaluating a qud_*
+# function on a chunk: the float64 temporaries created while evaluating the
+# expression, and the output.
+QUD_BYTES_PER_ELEMENT = 256
+
+# Chunk size, in elements, used by qud_parallel so that the temporaries of
+# each chunk stay within a core's cache.
+QUD_CACHE_CHUNK_SIZE = 16_384
+
+
+def qud_chunk_size(memory_bytes: int):
+    """Calculate the number of elements per chunk fitting within a memory budget
+
+    Args:
+        memory_bytes (int): Memory, in bytes, which evaluation of one chunk may use
+
+    Returns:
+        int: Number of elements per chunk
+    """
+    return max(1, int(memory_bytes) // QUD_BYTES_PER_ELEMENT)
+
+
+def qud_broadcast_shape(**params):
+    """Calculate the shape of the grid described by broadcasting qud_* parameters
+
+    Args:
+        **params: Keyword arguments as passed to a qud_* function, each a scalar or array
+
+    Returns:
+        tuple: Broadcast shape of all parameters
+    """
+    return np.broadcast_shapes(*(np.shape(v) for v in params.values()))
+
+
+def _grid_blocks(shape: tuple, chunk_size: int):
+    """Split a grid into blocks of at most chunk_size elements, contiguous in C-order
+
+    Yields:
+        tuple: Flat index of the first element in the block, and a tuple of slices selecting the block
+    """
+    if 0 in shape:
+        return
+    axis = 0
+    while axis < len(shape) and int(np.prod(shape[axis + 1:])) > chunk_size:
+        axis += 1
+    if axis == len(shape):
+        yield 0, ()
+        return
+    inner = int(np.prod(shape[axis + 1:]))
+    step = max(1, chunk_size // inner)
+    start = 0
+    for outer in np.ndindex(*shape[:axis]):
+        for low in range(0, shape[axis], step):
+            high = min(low + step, shape[axis])
+            yield start, tuple(slice(i, i + 1) for i in outer) + (slice(low, high),)
+            start += (high - low) * inner
+
+
+def _block_params(params: dict, shape: tuple, block: tuple):
+    """Slice each parameter down to the part broadcasting over a block of the grid"""
+    sliced = {}
+    for name, value in params.items():
+        value = np.asarray(value)
+        value = value.reshape((1,) * (len(shape) - value.ndim) + value.shape)
+        sliced[name] = value[tuple(s if n > 1 else slice(None) for s, n in zip(block, value.shape))]
+    return sliced
+
+
+def _block_shape(shape: tuple, block: tuple):
+    return tuple(s.stop - s.start for s in block) + tuple(shape[len(block):])
+
+
+def qud_iter_chunks(func, chunk_size: int = 1_000_000, **params):
+    """Lazily evaluate a qud_* function over a broadcast grid, one chunk at a time
+
+    The grid is described by the broadcast of the parameters, which may be
+    scalars or arrays of broadcast-compatible shapes, such as KD, t0 and l0
+    axes shaped (n, 1, 1), (1, n, 1) and (1, 1, n).  Chunks are consecutive
+    C-order blocks of at most chunk_size elements, and only one chunk of
+    inputs and output is in memory at once, see qud_chunk_size.
+
+    Args:
+        func (callable): qud_* function to evaluate
+        chunk_size (int): Maximum number of grid elements evaluated per chunk
+        **params: Keyword arguments to func, each a scalar or array
+
+    Yields:
+        tuple: Flat (C-order) index of the first element in the chunk, and the 1D array of results
+    """
+    shape = qud_broadcast_shape(**params)
+    for start, block in _grid_blocks(shape, chunk_size):
+        values = func(**_block_params(params, shape, block))
+        yield start, np.broadcast_to(values, _block_shape(shape, block)).reshape(-1)
+
+
+class QudArgExtreme:
+    """Streaming reducer finding the minimum or maximum of a grid, and its index
+
+    NaNs are ignored, as with np.nanargmin and np.nanargmax.
+
+    Args:
+        maximum (bool): Find the maximum rather than the minimum
+    """
+
+    def __init__(self, maximum: bool = False):
+        self.maximum = maximum
+
+    def start(self, shape: tuple):
+        self.shape = shape
+        self.value, self.index = np.nan, None
+
+    def update(self, start: int, values: np.ndarray):
+        if np.all(np.isnan(values)):
+            return
+        i = np.nanargmax(values) if self.maximum else np.nanargmin(values)
+        better = values[i] > self.value if self.maximum else values[i] < self.value
+        if self.index is None or better:
+            self.value, self.index = values[i], start + i
+
+    def result(self):
+        if self.index is None:
+            raise ValueError(f"Cannot find the {'maximum' if self.maximum else 'minimum'} of an empty or all-NaN grid "
+                             f"of shape {self.shape}")
+        return self.value, np.unravel_index(self.index, self.shape)
+
+
+class QudHistogram:
+    """Streaming reducer counting grid values into bins
+
+    Args:
+        bins (np.ndarray): Monotonically increasing bin edges, as for np.histogram
+    """
+
+    def __init__(self, bins):
+        self.bins = np.asarray(bins)
+
+    def start(self, shape: tuple):
+        self.counts = np.zeros(len(self.bins) - 1, dtype=np.int64)
+
+    def update(self, start: int, values: np.ndarray):
+        self.counts += np.histogram(values, self.bins)[0]
+
+    def result(self):
+        return self.counts, self.bins
+
+
+class QudCrossings:
+    """Streaming reducer finding where grid values cross a threshold along the last grid axis
+
+    A crossing is recorded at element i when it lies on the other side of the
+    threshold to element i-1 of the same row, so only the crossings, and not
+    the grid, are held in memory.
+
+    Args:
+        threshold (float): Threshold value
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+
+    def start(self, shape: tuple):
+        self.shape = shape
+        self.row_length = shape[-1] if shape else 1
+        self.crossings = [np.empty(0, dtype=np.intp)]
+        self.previous = None
+
+    def update(self, start: int, values: np.ndarray):
+        above = values >= self.threshold
+        if self.previous is not None:
+            above = np.concatenate([[self.previous], above])
+        else:
+            start += 1
+        flat = np.flatnonzero(above[1:] != above[:-1]) + start
+        self.crossings.append(flat[flat % self.row_length != 0])
+        self.previous = above[-1]
+
+    def result(self):
+        if not self.shape:
+            # A single element has nothing to cross to
+            return ()
+        return np.unravel_index(np.concatenate(self.crossings), self.shape)
+
+
+def qud_stream_reduce(func, reducers: list, chunk_size: int = 1_000_000, **params):
+    """Apply several streaming reductions to a qud_* function in a single pass over a broadcast grid
+
+    Each chunk is evaluated once and passed to every reducer, so that, for
+    example, the minimum, maximum and a histogram of a grid cost one
+    evaluation of the grid rather than three.
+
+    Args:
+        func (callable): qud_* function to evaluate
+        reducers (list): QudArgExtreme, QudHistogram or QudCrossings reducers
+        chunk_size (int): Number of grid elements evaluated per chunk
+        **params: Keyword arguments to func, each a scalar or array
+
+    Returns:
+        list: Result of each reducer, as returned by the corresponding qud_stream_* function
+    """
+    shape = qud_broadcast_shape(**params)
+    for reducer in reducers:
+        reducer.start(shape)
+    for start, values in qud_iter_chunks(func, chunk_size, **params):
+        for reducer in reducers:
+            reducer.update(start, values)
+    return [reducer.result() for reducer in reducers]
+
+
+def qud_stream_argmin(func, chunk_size: int = 1_000_000, **params):
+    """Find the minimum of a qud_* function over a broadcast grid without materialising it
+
+    NaNs are ignored, as with np.nanargmin.  Raises ValueError for an empty or all-NaN grid.
+
+    Args:
+        func (callable): qud_* function to evaluate
+        chunk_size (int): Number of grid elements evaluated per chunk
+        **params: Keyword arguments to func, each a scalar or array
+
+    Returns:
+        tuple: Minimum value, and its index into the broadcast grid
+    """
+    return qud_stream_reduce(func, [QudArgExtreme()], chunk_size, **params)[0]
+
+
+def qud_stream_argmax(func, chunk_size: int = 1_000_000, **params):
+    """Find the maximum of a qud_* function over a broadcast grid without materialising it
+
+    NaNs are ignored, as with np.nanargmax.  Raises ValueError for an empty or all-NaN grid.
+
+    Args:
+        func (callable): qud_* function to evaluate
+        chunk_size (int): Number of grid elements evaluated per chunk
+        **params: Keyword arguments to func, each a scalar or array
+
+    Returns:
+        tuple: Maximum value, and its index into the broadcast grid
+    """
+    return qud_stream_reduce(func, [QudArgExtreme(maximum=True)], chunk_size, **params)[0]
+
+
+def qud_stream_histogram(func, bins, chunk_size: int = 1_000_000, **params):
+    """Histogram a qud_* function over a broadcast grid without materialising it
+
+    Args:
+        func (callable): qud_* function to evaluate
+        bins (np.ndarray): Monotonically increasing bin edges, as for np.histogram
+        chunk_size (int): Number of grid elements evaluated per chunk
+        **params: Keyword arguments to func, each a scalar or array
+
+    Returns:
+        tuple: Counts per bin, and the bin edges
+    """
+    return qud_stream_reduce(func, [QudHistogram(bins)], chunk_size, **params)[0]
+
+
+def qud_stream_crossings(func, threshold: float, chunk_size: int = 1_000_000, **params):
+    """Find where a qud_* function crosses a threshold along the last grid axis
+
+    See QudCrossings.
+
+    Args:
+        func (callable): qud_* function to evaluate
+        threshold (float): Threshold value
+        chunk_size (int): Number of grid elements evaluated per chunk
+        **params: Keyword arguments to func, each a scalar or array
+
+    Returns:
+        tuple: Index arrays into the broadcast grid of the elements following each crossing, empty for a 0-d grid
+    """
+    return qud_stream_reduce(func, [QudCrossings(threshold)], chunk_size, **params)[0]
+
+
+def qud_parallel(func, workers: int = None, chunk_size: int = QUD_CACHE_CHUNK_SIZE, **params):
+    """Evaluate a qud_* function on a thread pool, chunk by chunk, into a preallocated output
+
+    NumPy releases the GIL within ufuncs, so chunks evaluated on separate
+    threads run concurrently.  Every element goes through exactly the same
+    operations as a single call to func, so results are bit-identical.
+
+    Args:
+        func (callable): qud_* function to evaluate
+        workers (int): Number of worker threads, defaults to the number of CPUs
+        chunk_size (int): Maximum number of elements evaluated per chunk
+        **params: Keyword arguments to func, each a scalar or array
+
+    Returns:
+        np.ndarray: Result, of the broadcast shape of the parameters
+    """
+    shape = qud_broadcast_shape(**params)
+    out = np.empty(shape, dtype=np.result_type(*params.values(), float))
+    # Worker threads do not inherit the caller's np.errstate, so floating
+    # point errors are handled as they would be in a single call to func
+    errors = np.geterr()
+
+    def evaluate(block):
+        with np.errstate(**errors):
+            out[block] = func(**_block_params(params, shape, block))
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for _ in executor.map(evaluate, (block for _, block in _grid_blocks(shape, chunk_size))):
+            pass
+    return out
@@ -0,0 +1,275 @@
+"""
+Optimized qµD kernels
+
+Generated by 15_generate_kernels.py from the qµD mass-balance equations.  Do
+not edit by hand, rerun the generator instead.
+"""
+from numpy import sqrt
+
+
+def qud_lred(t0: float, l0: float, kdtl: float, redvol: float, whitevol: float, pc: float):
+    """Calculate the compound concentration in the red chamber in a partially equlibrated system
+
+    Generated equivalent of microdialysis_equations.qud_lred, see its
+    docstring for arguments.
+    """
+    x0 = pc*redvol
+    x1 = whitevol + x0
+    x2 = redvol + whitevol
+    x3 = kdtl*whitevol
+    x4 = t0*whitevol
+    x5 = l0*pc
+    x6 = 2*x0
+    x7 = x0*x4 + x1*x3
+    return (1/2)*(x2*x5*(whitevol + x6) + x7 - sqrt(-4*l0*pc**2*redvol*x1*x2*(l0*x0 + whitevol*x5 + x3 + x4) + (x5*(redvol*whitevol + whitevol**2 + x2*x6) + x7)**2))/(pc*redvol*x1)
+
+
+def qud_lred_derivatives(t0: float, l0: float, kdtl: float, redvol: float, whitevol: float, pc: float):
+    """Partial derivatives of qud_lred with respect to each argument
+
+    Returns:
+        dict: Argument names mapped to partial derivatives
+    """
+    x0 = pc*redvol
+    x1 = l0*x0
+    x2 = l0*pc
+    x3 = whitevol*x2
+    x4 = t0*x0
+    x5 = kdtl*whitevol
+    x6 = kdtl*x0
+    x7 = x5 + x6
+    x8 = x4 + x7
+    x9 = redvol + whitevol
+    x10 = t0*whitevol
+    x11 = x10 + x5
+    x12 = x1 + x3
+    x13 = whitevol + x0
+    x14 = redvol*x13
+    x15 = whitevol**2
+    x16 = redvol*whitevol
+    x17 = 2*x0
+    x18 = x15 + x16 + x17*x9
+    x19 = x0*x10 + x13*x5
+    x20 = sqrt(-4*l0*pc**2*x14*x9*(x11 + x12) + (x18*x2 + x19)**2)
+    x21 = 1/(x20)
+    x22 = whitevol*x21
+    x23 = 1/(x13)
+    x24 = (1/2)*x23
+    x25 = whitevol*x24
+    x26 = whitevol + x17
+    x27 = 1/(redvol)
+    x28 = x24*x27
+    x29 = 1/(pc)
+    x30 = x27*x29
+    x31 = x26*x9
+    x32 = x19 + x2*x31 - x20
+    x33 = x23*x32
+    x34 = -x33
+    x35 = 2*redvol
+    x36 = x30*x32
+    x37 = kdtl**2
+    x38 = l0**2
+    x39 = 2*x1
+    x40 = x15*x21
+    x41 = 2*whitevol
+    x42 = redvol + x41
+    x43 = 2*x15
+    x44 = 3*whitevol
+    x45 = x35 + x44
+    x46 = 2*x9
+    return {'t0': -x25*(x22*(-x1 - x3 + x8) - 1), 'l0': -x28*x9*(x15*x21*(x12 - x4 + x7) - x26), 'kdtl': x25*x30*(-x13*x22*(x12 + x8) + x13), 'redvol': x28*(l0*(2*pc*(whitevol + x35) + whitevol) + x11 + x34 - x36 - x40*(kdtl*x39 + l0*x5 + pc*whitevol*x38 + t0**2*x0 - t0*x39 + t0*x5 + 2*t0*x6 + whitevol*x37 + x0*x37 + x0*x38 - x10*x2 + x2*x5)), 'whitevol': x24*x30*(kdtl*(x0 + x41) + x2*(x17 + x42) - x22*(x2*(kdtl*(x0*x45 + 4*x15 + 3*x16) + x2*(redvol*(redvol + x44) + x43)) + x37*(x0*(x0 + x44) + x43) + x4*(kdtl*(x17 + x44) - x2*x45 + x4)) + x34 + x4), 'pc': x24*x29*(x27*(kdtl*x16 + l0*x31 + t0*x16 + x1*x46 - x40*(l0*(kdtl*x18 + x2*(redvol*x42 + x15)) + redvol*t0*(kdtl*x26 - x2*x46 + x4) + x14*x37)) - x33 - x36)}
+
+
+def qud_lwhite(t0: float, l0: float, kdtl: float, redvol: float, whitevol: float, pc: float):
+    """Calculate the compound concentration in the white chamber in a partially equlibrated system
+
+    Generated equivalent of microdialysis_equations.qud_lwhite, see its
+    docstring for arguments.
+    """
+    x0 = pc*redvol
+    x1 = whitevol + x0
+    x2 = kdtl*x1
+    x3 = l0*pc*(redvol + whitevol)
+    x4 = t0*x0 + x2 - x3
+    return -1/2*(x4 - sqrt(4*x2*x3 + x4**2))/(pc*x1)
+
+
+def qud_lwhite_derivatives(t0: float, l0: float, kdtl: float, redvol: float, whitevol: float, pc: float):
+    """Partial derivatives of qud_lwhite with respect to each argument
+
+    Returns:
+        dict: Argument names mapped to partial derivatives
+    """
+    x0 = pc*redvol
+    x1 = t0*x0
+    x2 = whitevol + x0
+    x3 = kdtl*x2
+    x4 = redvol + whitevol
+    x5 = l0*pc
+    x6 = x4*x5
+    x7 = x1 + x3 - x6
+    x8 = sqrt(4*x3*x6 + x7**2)
+    x9 = 1/(x8)
+    x10 = 1/(x2)
+    x11 = (1/2)*x10
+    x12 = kdtl*x0
+    x13 = kdtl*whitevol + l0*x0 + whitevol*x5 + x12
+    x14 = 1/(pc)
+    x15 = x11*x14
+    x16 = 2*x3
+    x17 = x7 - x8
+    x18 = x10*x17
+    x19 = -kdtl + x18
+    x20 = kdtl*redvol
+    x21 = redvol*t0
+    x22 = l0*x4
+    return {'t0': -redvol*x11*(-x7*x9 + 1), 'l0': x11*x4*(x9*(-x1 + x13) + 1), 'kdtl': -x15*(-x2*x9*(x1 + x13) + x2), 'redvol': x11*(l0 - t0 + x19 + x9*(2*kdtl*x6 + l0*x16 + x7*(kdtl - l0 + t0))), 'whitevol': x15*(x19 + x5 + x9*(kdtl**2*x2 + x1*(kdtl - x5) + x5*(kdtl*(redvol + 2*whitevol + x0) + x6))), 'pc': x15*(redvol*x18 + x14*x17 - x20 - x21 + x22 + x9*(2*x12*x22 + x16*x22 + x7*(x20 + x21 - x22)))}
+
+
+def qud_pt(t0: float, l0: float, kdtl: float, redvol: float, whitevol: float, pc: float):
+    """Calculate the pt value in a partially equlibrated system
+
+    Generated equivalent of microdialysis_equations.qud_pt, see its
+    docstring for arguments.
+    """
+    x0 = l0*pc*(redvol + whitevol)
+    x1 = pc*redvol
+    x2 = kdtl*(-whitevol + x1) + t0*x1 - x0
+    return (1/2)*(x2 + sqrt(4*kdtl*x1*(kdtl*whitevol + t0*whitevol + x0) + x2**2))/(kdtl*redvol)
+
+
+def qud_pt_derivatives(t0: float, l0: float, kdtl: float, redvol: float, whitevol: float, pc: float):
+    """Partial derivatives of qud_pt with respect to each argument
+
+    Returns:
+        dict: Argument names mapped to partial derivatives
+    """
+    x0 = pc*redvol
+    x1 = l0*x0
+    x2 = l0*pc
+    x3 = whitevol*x2
+    x4 = t0*x0
+    x5 = kdtl*whitevol
+    x6 = kdtl*x0
+    x7 = x5 + x6
+    x8 = x4 + x7
+    x9 = redvol + whitevol
+    x10 = x2*x9
+    x11 = t0*whitevol + x5
+    x12 = -whitevol + x0
+    x13 = kdtl*x12 - x10 + x4
+    x14 = sqrt(x13**2 + 4*x6*(x10 + x11))
+    x15 = 1/(x14)
+    x16 = 1/(kdtl)
+    x17 = (1/2)*x16
+    x18 = pc*x17
+    x19 = 1/(redvol)
+    x20 = x1 + x3
+    x21 = -x13 - x14
+    x22 = whitevol + x0
+    x23 = x17*x19
+    x24 = kdtl**2*x22
+    x25 = 2*redvol
+    x26 = pc*(whitevol + x25)
+    x27 = kdtl*redvol - l0*x9 + redvol*t0
+    return {'t0': x18*(x15*(-x1 - x3 + x8) + 1), 'l0': -x18*x19*x9*(-x15*(x20 - x4 + x7) + 1), 'kdtl': x23*(x12 + x15*x22*(x20 + x8) + x16*x21), 'redvol': x23*(pc*(kdtl - l0 + t0 + x15*(l0*(kdtl*(whitevol + x26) + x10) + t0*(kdtl*(whitevol + 2*x0) - l0*x26 + x4) + x24)) + x19*x21), 'whitevol': -x23*(kdtl - x15*(x2*(kdtl*(redvol + 2*whitevol + x0) + x10) + x24 + x4*(kdtl - x2)) + x2), 'pc': x23*(x15*(kdtl*x25*(2*x10 + x11) + x13*x27) + x27)}
+
+
+def qud_Kd_from_pt(pt: float, t0: float, l0: float, redvol: float, whitevol: float, pc: float):
+    """Calculate the protein-ligand interaction Kd from Pt in a partially equilibrated system
+
+    Generated equivalent of microdialysis_equations.qud_Kd_from_pt, see its
+    docstring for arguments.
+    """
+    x0 = pc - pt
+    x1 = pt*redvol + whitevol
+    return -pc*(l0*x0*(redvol + whitevol) + t0*x1)/(x0*x1)
+
+
+def qud_Kd_from_pt_derivatives(pt: float, t0: float, l0: float, redvol: float, whitevol: float, pc: float):
+    """Partial derivatives of qud_Kd_from_pt with respect to each argument
+
+    Returns:
+        dict: Argument names mapped to partial derivatives
+    """
+    x0 = pc - pt
+    x1 = 1/(x0)
+    x2 = pt*redvol + whitevol
+    x3 = redvol + whitevol
+    x4 = l0*x0
+    x5 = t0*x2 + x3*x4
+    x6 = 1/(x2)
+    x7 = pc*x1
+    x8 = x6*x7
+    x9 = pc*x3
+    return {'pt': x8*(l0*redvol + l0*whitevol - redvol*t0 + redvol*x5*x6 - x1*x5), 't0': -x7, 'l0': -x6*x9, 'redvol': x8*(-pt*t0 + pt*x5*x6 - x4), 'whitevol': x8*(-t0 - x4 + x5*x6), 'pc': x1*x6*(-l0*x9 + pc*x1*x5 - x5)}
+
+
+def qud_Kd_from_lred(lred: float, t0: float, l0: float, redvol: float, whitevol: float, pc: float):
+    """Calculate the protein-ligand interaction Kd from ligand in red chamber in a partially equilibrated system
+
+    Generated equivalent of microdialysis_equations.qud_Kd_from_lred, see its
+    docstring for arguments.
+    """
+    x0 = l0*(redvol + whitevol)
+    x1 = -lred*(pc*redvol + whitevol) + pc*x0
+    return -pc*(-lred*redvol + x0)*(t0*whitevol + x1)/(whitevol*x1)
+
+
+def qud_Kd_from_lred_derivatives(lred: float, t0: float, l0: float, redvol: float, whitevol: float, pc: float):
+    """Partial derivatives of qud_Kd_from_lred with respect to each argument
+
+    Returns:
+        dict: Argument names mapped to partial derivatives
+    """
+    x0 = pc*redvol + whitevol
+    x1 = -lred*redvol
+    x2 = redvol + whitevol
+    x3 = l0*x2
+    x4 = x1 + x3
+    x5 = x0*x4
+    x6 = -lred*x0 + pc*x3
+    x7 = t0*whitevol + x6
+    x8 = 1/(x6)
+    x9 = 1/(whitevol)
+    x10 = x8*x9
+    x11 = pc*x10
+    x12 = pc*x4
+    x13 = x11*(pc*x4*x7*x8 - x12 - x7)
+    x14 = -lred
+    x15 = l0*pc + x14
+    x16 = l0*redvol + l0*whitevol + x1
+    return {'lred': x11*(redvol*x7 - x5*x7*x8 + x5), 't0': -x12*x8, 'l0': x13*x2, 'redvol': x13*(l0 + x14), 'whitevol': x11*(-l0*x7 + x15*x4*x7*x8 + x4*x7*x9 - x4*(t0 + x15)), 'pc': x10*(-pc*x16**2 + pc*x16*x4*x7*x8 - x4*x7)}
+
+
+def qud_Kd_from_lwhite(lwhite: float, t0: float, l0: float, redvol: float, whitevol: float, pc: float):
+    """Calculate the protein-ligand interaction Kd from ligand in white chamber in a partially equilibrated system
+
+    Generated equivalent of microdialysis_equations.qud_Kd_from_lwhite, see its
+    docstring for arguments.
+    """
+    x0 = l0*(redvol + whitevol)
+    x1 = lwhite*(pc*redvol + whitevol)
+    return lwhite*pc*(redvol*t0 - x0 + x1)/(x0 - x1)
+
+
+def qud_Kd_from_lwhite_derivatives(lwhite: float, t0: float, l0: float, redvol: float, whitevol: float, pc: float):
+    """Partial derivatives of qud_Kd_from_lwhite with respect to each argument
+
+    Returns:
+        dict: Argument names mapped to partial derivatives
+    """
+    x0 = redvol + whitevol
+    x1 = l0*x0
+    x2 = pc*redvol
+    x3 = lwhite*(whitevol + x2)
+    x4 = 1/(x1 - x3)
+    x5 = redvol*t0 - x1
+    x6 = x3 + x5
+    x7 = x4*x6
+    x8 = lwhite*x2
+    x9 = lwhite*pc
+    x10 = x4*x9
+    x11 = x10*(x7 + 1)
+    x12 = l0 - x9
+    return {'lwhite': pc*x4*(x3*x7 + 2*x3 + x5), 't0': x4*x8, 'l0': -x0*x11, 'redvol': x10*(t0 - x12*x7 - x12), 'whitevol': -x11*(l0 - lwhite), 'pc': lwhite*x4*(x6 + x7*x8 + x8)}